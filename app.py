@@ -4,16 +4,74 @@
 Flask web application to display station list
 """
 
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash, Response, stream_with_context, send_from_directory, g, before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
 import sqlite3
 import os
+import json
+import mimetypes
 import secrets
+import time
+
+from build_assets import DIST_DIR, MANIFEST_PATH, VENDOR_ASSETS
+from change_log import (CHANGE_FEED_PAGE_SIZE, init_change_log, get_change_log_meta, compact_change_log,
+                        get_changes, last_change_seq)
+from partitions import (BASINS, list_partitions, station_db_path, find_station, river_basin, ensure_basin,
+                        attach_catalog, invalidate_catalog, file_signature, network_query)
 
 app = Flask(__name__)
+
+# === Jinja bytecode cache: template ที่ compile แล้วใช้ร่วมกันทุก worker และอยู่รอดหลังรีสตาร์ท ===
+# ต้องตั้งค่าก่อนที่ app.jinja_env จะถูกสร้าง
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jinja_cache")
+try:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)}
+except OSError as e:
+    print("Warning: template bytecode cache disabled:", str(e))
 app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)  # จำเป็นสำหรับ session
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kok_data.db")
 print("DB Path:", os.path.abspath(DB_PATH))
 
+# === Static assets ที่ผ่าน build_assets.py (ชื่อไฟล์มี hash จึง cache ได้ถาวร) ===
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+def load_asset_manifest():
+    """Load the manifest written by build_assets.py, or an empty one if not built"""
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = load_asset_manifest()
+
+@app.template_global()
+def asset_url(path):
+    """URL of a static file, using its fingerprinted copy when one was built"""
+    hashed_path = ASSET_MANIFEST.get(path)
+    if hashed_path:
+        return url_for('assets', filename=hashed_path)
+    # ไฟล์ JS ที่ยังไม่ผ่านการ vendor พร้อมตรวจ sha256 → ใช้ CDN เดิม
+    if path in VENDOR_ASSETS:
+        return VENDOR_ASSETS[path]['url']
+    return url_for('static', filename=path)
+
+@app.route('/assets/<path:filename>')
+def assets(filename):
+    """Serve fingerprinted assets with immutable caching and precompressed variants"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 # === Helper: ตรวจสอบว่าล็อกอินหรือยัง ===
 def login_required(f):
     from functools import wraps
@@ -63,12 +121,37 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+# === จับเวลาการ render template แยกเป็น hot path ของตัวเอง (ส่งออกทาง Server-Timing header) ===
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        g.setdefault('render_timings', []).append((template.name, (time.perf_counter() - started) * 1000))
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get('render_timings')
+    if timings:
+        response.headers.add('Server-Timing', ', '.join(
+            f'render;dur={duration:.2f};desc="{name}"' for name, duration in timings
+        ))
+    return response
+
+@app.cli.command('compile-templates')
+def compile_templates():
+    """Compile every template into the bytecode cache"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+        print(f"  ✓ {name}")
+
 def get_stations():
     """Get all stations from database"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    
-    cursor = conn.execute("""
+    init_databases()
+    rows = network_query("""
         SELECT 
             id,
             "\ufeffแม่น้ำ" as river,
@@ -79,19 +162,16 @@ def get_stations():
             "จังหวัด" as province
         FROM station_data
         ORDER BY "\ufeffแม่น้ำ", "สถานี"
-    """)
+    """, sort_key=lambda row: (row['river'] or '', row['station'] or ''))
     
     stations = []
-    for row in cursor.fetchall():
-        station_dict = dict(row)
+    for station_dict in rows:
         # Clean up whitespace from all string fields
         for key, value in station_dict.items():
             if isinstance(value, str):
                 station_dict[key] = value.strip()
         stations.append(station_dict)
     
-    conn.close()
-    
     return stations
 
 @app.route('/')
@@ -147,9 +227,72 @@ def test():
     """Simple test endpoint"""
     return "Flask app is working!"
 
+@app.route('/api/changes')
+def api_changes():
+    """Stream changes since a sequence number as newline-delimited JSON"""
+    since = request.args.get('since', 0, type=int)
+    # LIMIT ที่ติดลบใน SQLite คือไม่จำกัด จึงต้องบังคับให้อยู่ในช่วง 1..CHANGE_FEED_PAGE_SIZE
+    limit = max(1, min(request.args.get('limit', CHANGE_FEED_PAGE_SIZE, type=int), CHANGE_FEED_PAGE_SIZE))
+    partition = request.args.get('partition', 'main')
+
+    # แต่ละ partition มี change log และ seq ของตัวเอง
+    paths = {p['name']: p['path'] for p in list_partitions()}
+    paths['main'] = DB_PATH
+    if partition not in paths:
+        return jsonify({'success': False, 'message': f'unknown partition: {partition}'}), 404
+
+    conn = connect_db(paths[partition])
+    epoch, horizon = get_change_log_meta(conn)
+    last_seq = last_change_seq(conn)
+    client_epoch = request.args.get('epoch')
+
+    # ข้อมูลเก่ากว่า horizon ถูกลบไปแล้ว หรือฐานข้อมูลถูกสร้างใหม่/ย้ายข้อมูล → ต้อง sync ใหม่ทั้งหมดจาก /api/stations
+    # (since ที่มากกว่า last_seq มาจากไฟล์เดิมก่อนถูกแทนที่)
+    if since < horizon or since > last_seq or (client_epoch and client_epoch != epoch):
+        conn.close()
+        response = jsonify({
+            'success': False,
+            'message': 'full resync required',
+            'epoch': epoch,
+            'horizon': horizon,
+            'last_seq': last_seq,
+        })
+        return response, 410
+
+    def generate():
+        try:
+            for change in get_changes(conn, since, limit):
+                yield json.dumps(change, ensure_ascii=False) + '\n'
+        finally:
+            conn.close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Change-Epoch'] = epoch
+    response.headers['X-Change-Last-Seq'] = str(last_seq)
+    return response
+
+@app.route('/api/partitions')
+def api_partitions():
+    """List storage partitions with the position of their change feed"""
+    partitions = [{'name': 'main', 'rivers': [], 'path': DB_PATH}] + list_partitions()
+    result = []
+    for partition in partitions:
+        conn = connect_db(partition['path'])
+        epoch, horizon = get_change_log_meta(conn)
+        last_seq = last_change_seq(conn)
+        conn.close()
+        result.append({
+            'name': partition['name'],
+            'rivers': partition['rivers'],
+            'epoch': epoch,
+            'horizon': horizon,
+            'last_seq': last_seq,
+        })
+    return jsonify(result)
+
 def get_station_by_code(station_code):
     """Get station information by station code"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(station_db_path(station_code, DB_PATH))
     conn.row_factory = sqlite3.Row
     
     cursor = conn.execute("""
@@ -179,7 +322,7 @@ def get_station_by_code(station_code):
 
 def get_water_data(station_code):
     """Get water quality data for a station, organized as pivot table"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(station_db_path(station_code, DB_PATH))
     conn.row_factory = sqlite3.Row
     
     cursor = conn.execute("""
@@ -269,7 +412,7 @@ def get_water_data(station_code):
 
 def get_soil_data(station_code):
     """Get soil quality data for a station, organized as pivot table"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(station_db_path(station_code, DB_PATH))
     conn.row_factory = sqlite3.Row
     
     cursor = conn.execute("""
@@ -353,10 +496,246 @@ def get_soil_data(station_code):
         'parameters': parameters
     }
 
+# === สถิติแนวโน้มของแต่ละสถานี × สิ่งที่ตรวจ (อัปเดตแบบ incremental) ===
+# เก็บผลรวมที่จำเป็นไว้ในตาราง series_stats เพื่อให้การเพิ่มผลตรวจหนึ่งครั้งใช้เวลา O(1)
+# แทนการคำนวณใหม่จากข้อมูลทั้งหมดทุกครั้งที่เปิดหน้า
+SERIES_SOURCES = {
+    'water': ('water_data', '"\ufeffสิ่งที่ตรวจ"'),
+    'soil': ('soil_data', '"สารที่ตรวจ"'),
+}
+
+def init_series_stats(conn):
+    """Create series_stats table and fill it from existing data if it is new"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'series_stats'"
+    ).fetchone()
+    if exists:
+        return
+    conn.execute('''
+        CREATE TABLE series_stats (
+            kind TEXT NOT NULL,
+            station TEXT NOT NULL,
+            parameter TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            min_value REAL NOT NULL,
+            max_value REAL NOT NULL,
+            sum_x REAL NOT NULL,
+            sum_xx REAL NOT NULL,
+            sum_xy REAL NOT NULL,
+            last_round INTEGER NOT NULL,
+            last_value REAL NOT NULL,
+            variance REAL NOT NULL,
+            slope REAL NOT NULL,
+            standardized_slope REAL NOT NULL,
+            latest_z REAL NOT NULL,
+            PRIMARY KEY (kind, station, parameter)
+        )
+    ''')
+    rebuild_series_stats(conn)
+
+def parse_round(check_number):
+    """Return the round number from 'ครั้งที่ X', or None if it is not numeric"""
+    try:
+        return int(check_number.split('ครั้งที่')[-1].strip())
+    except (AttributeError, ValueError):
+        return None
+
+def update_series_stats(cur, kind, station, parameter, check_number, numeric_value, schema='main'):
+    """Add one measurement to the statistics of its series in O(1)
+
+    `schema` selects the database when other files are attached to `cur`.
+    """
+    x = parse_round(check_number)
+    if numeric_value is None or x is None:
+        return
+    y = float(numeric_value)
+    station = station.strip()
+    parameter = parameter.strip()
+
+    row = cur.execute(f'''
+        SELECT n, mean, m2, min_value, max_value, sum_x, sum_xx, sum_xy, last_round, last_value
+        FROM {schema}.series_stats WHERE kind = ? AND station = ? AND parameter = ?
+    ''', (kind, station, parameter)).fetchone()
+    if row:
+        n, mean, m2, min_value, max_value, sum_x, sum_xx, sum_xy, last_round, last_value = row
+    else:
+        n, mean, m2, min_value, max_value, sum_x, sum_xx, sum_xy, last_round, last_value = 0, 0.0, 0.0, y, y, 0.0, 0.0, 0.0, x, y
+
+    # Welford สำหรับค่าเฉลี่ยและความแปรปรวน
+    n += 1
+    delta = y - mean
+    mean += delta / n
+    m2 += delta * (y - mean)
+    min_value = min(min_value, y)
+    max_value = max(max_value, y)
+
+    # ผลรวมสำหรับความชัน least-squares ของค่าที่วัดได้เทียบกับครั้งที่ตรวจ
+    sum_x += x
+    sum_xx += x * x
+    sum_xy += x * y
+    if x >= last_round:
+        last_round, last_value = x, y
+
+    variance = m2 / (n - 1) if n > 1 else 0.0
+    std = variance ** 0.5
+    denominator = n * sum_xx - sum_x * sum_x
+    slope = (n * sum_xy - sum_x * mean * n) / denominator if denominator else 0.0
+    standardized_slope = slope / std if std else 0.0
+    latest_z = (last_value - mean) / std if std else 0.0
+
+    cur.execute(f'''
+        INSERT OR REPLACE INTO {schema}.series_stats (
+            kind, station, parameter, n, mean, m2, min_value, max_value, sum_x, sum_xx, sum_xy,
+            last_round, last_value, variance, slope, standardized_slope, latest_z
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (kind, station, parameter, n, mean, m2, min_value, max_value, sum_x, sum_xx, sum_xy,
+          last_round, last_value, variance, slope, standardized_slope, latest_z))
+
+def delete_series_stats(cur, station, schema='main'):
+    """Remove the statistics of every series of a station"""
+    cur.execute(f'DELETE FROM {schema}.series_stats WHERE station = ?', (station.strip(),))
+
+def rebuild_series_stats(conn):
+    """Recompute series_stats from water_data and soil_data (after an import)"""
+    cur = conn.cursor()
+    cur.execute('DELETE FROM series_stats')
+    for kind, (table, parameter_column) in SERIES_SOURCES.items():
+        rows = conn.execute(f'''
+            SELECT "สถานี", {parameter_column}, "ครั้งที่ตรวจ", "ค่าที่วัดได้"
+            FROM {table} WHERE "ค่าที่วัดได้" IS NOT NULL
+        ''').fetchall()
+        for station, parameter, check_number, numeric_value in rows:
+            if station and parameter:
+                update_series_stats(cur, kind, station, parameter, check_number, numeric_value)
+    conn.commit()
+
+def format_series_stats(row):
+    """Convert a series_stats row to the dict returned by the API"""
+    return {
+        'kind': row['kind'],
+        'station': row['station'],
+        'parameter': row['parameter'],
+        'count': row['n'],
+        'mean': row['mean'],
+        'variance': row['variance'],
+        'min': row['min_value'],
+        'max': row['max_value'],
+        'slope': row['slope'],
+        'standardized_slope': row['standardized_slope'],
+        'latest_round': row['last_round'],
+        'latest_value': row['last_value'],
+        'latest_z': row['latest_z'],
+    }
+
+def get_station_trends(station_code):
+    """Get trend statistics of every series of a station, grouped by kind"""
+    conn = connect_db(station_db_path(station_code, DB_PATH))
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute('''
+        SELECT * FROM series_stats WHERE station = ? ORDER BY kind, parameter
+    ''', (station_code.strip(),)).fetchall()
+    conn.close()
+
+    trends = {kind: [] for kind in SERIES_SOURCES}
+    for row in rows:
+        trends[row['kind']].append(format_series_stats(row))
+    return trends
+
+def init_database(conn):
+    """Create the change log and series statistics of one database file"""
+    init_change_log(conn)
+    init_series_stats(conn)
+
+# ฐานข้อมูลหลักและทุก partition มี change log และสถิติของตัวเอง
+# ตัดสินจากตัวไฟล์ (PRAGMA user_version) ไม่ใช่ inode เพราะไฟล์ที่ import ใหม่อาจได้ inode เดิมกลับมา
+DB_SCHEMA_VERSION = 1
+
+def connect_db(path):
+    """Connect to a database file, initialising it if it has not been yet"""
+    conn = sqlite3.connect(path)
+    if conn.execute('PRAGMA user_version').fetchone()[0] < DB_SCHEMA_VERSION:
+        init_database(conn)
+        conn.execute(f'PRAGMA user_version = {DB_SCHEMA_VERSION}')
+    return conn
+
+# signature ของแต่ละไฟล์ตอนตรวจครั้งล่าสุด ไฟล์ที่ไม่เปลี่ยนเลยไม่ต้องเปิดตรวจซ้ำ
+_checked_files = {}
+
+def init_databases():
+    """Initialise the main database and every partition that needs it"""
+    for path in [DB_PATH] + [p['path'] for p in list_partitions()]:
+        if _checked_files.get(path) != file_signature(path):
+            connect_db(path).close()
+            _checked_files[path] = file_signature(path)
+
+# ไม่ init ตอน import เพื่อให้ compile-templates และ bench_templates.py ไม่แตะไฟล์ข้อมูล
+@app.cli.command('init-db')
+def init_db_command():
+    """Create change logs and series statistics in every database file"""
+    init_databases()
+    print("  ✓ Databases initialised")
+
+# จำนวนชุดข้อมูลสูงสุดที่ /api/trends ส่งกลับในครั้งเดียว
+TRENDS_MAX_LIMIT = 500
+
+@app.route('/api/stations/<station_code>/trends')
+def api_station_trends(station_code):
+    """API endpoint for trend statistics of one station"""
+    return jsonify(get_station_trends(station_code))
+
+@app.route('/api/trends')
+def api_trends():
+    """Rank series network-wide, fastest rising first
+
+    Without ?parameter= series are ranked by standardized_slope (change per
+    round in standard deviations) so that different units are comparable.
+    """
+    kind = request.args.get('kind', 'water')
+    parameter = request.args.get('parameter', '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), TRENDS_MAX_LIMIT))
+    min_count = request.args.get('min_count', 3, type=int)
+    if kind not in SERIES_SOURCES:
+        return jsonify({'success': False, 'message': f'unknown kind: {kind}'}), 400
+
+    order_column = 'slope' if parameter else 'standardized_slope'
+    init_databases()
+    rows = network_query(f'''
+        SELECT * FROM series_stats
+        WHERE kind = ? AND n >= ? AND (? = '' OR parameter = ?)
+        ORDER BY {order_column} DESC
+        LIMIT ?
+    ''', (kind, min_count, parameter, parameter, limit),
+        sort_key=lambda row: row[order_column], reverse=True, limit=limit)
+    return jsonify([format_series_stats(row) for row in rows])
+
+def unknown_river_message(river):
+    """Error shown when a form names a river that is not in any basin"""
+    rivers = ', '.join(river for rivers in BASINS.values() for river in rivers)
+    return f'ไม่รู้จักแม่น้ำ "{river}" (แม่น้ำที่รองรับ: {rivers})'
+
+def compact_committed(path):
+    """Compact a file's change log after a write was committed
+
+    The write itself already succeeded, so a failure here is only logged;
+    the next write to the file compacts it again.
+    """
+    conn = None
+    try:
+        conn = connect_db(path)
+        compact_change_log(conn)
+    except sqlite3.Error as e:
+        print("Error compacting change log:", str(e))
+    finally:
+        if conn is not None:
+            conn.close()
+
 @app.route('/add-station', methods=['GET', 'POST'])
 @login_required
 def add_station():
     if request.method == 'POST':
+        conn = None
         try:
             # 1. รับข้อมูลสถานี
             station = request.form['station'].strip()
@@ -366,8 +745,16 @@ def add_station():
             province = request.form['province'].strip()
             location = request.form['location'].strip()
 
-            conn = sqlite3.connect(DB_PATH)
+            # สถานีใหม่เก็บในไฟล์ของลุ่มน้ำที่แม่น้ำนั้นอยู่
+            basin = river_basin(river)
+            if not basin:
+                return jsonify({'success': False, 'message': unknown_river_message(river)}), 400
+            if find_station(station, DB_PATH):
+                return jsonify({'success': False, 'message': f'รหัสสถานี {station} มีอยู่แล้ว'}), 400
+            path = ensure_basin(basin)
+            conn = connect_db(path)
             cur = conn.cursor()
+            attach_catalog(conn)
 
             # 2. บันทึกสถานี
             cur.execute('''
@@ -397,6 +784,7 @@ def add_station():
                             INSERT INTO water_data ("สถานี", "\ufeffสิ่งที่ตรวจ", "หน่วย", "ครั้งที่ตรวจ", "ค่าที่ได้", "ค่าที่วัดได้")
                             VALUES (?, ?, ?, ?, ?, ?)
                         ''', (station, param, unit, f'ครั้งที่ {i}', value, numeric_value))
+                        update_series_stats(cur, 'water', station, param, f'ครั้งที่ {i}', numeric_value)
 
             # 5. บันทึกข้อมูลดิน (8 ครั้ง)
             for i in range(1, 9):
@@ -414,14 +802,21 @@ def add_station():
                             INSERT INTO soil_data ("สถานี", "สารที่ตรวจ", "ครั้งที่ตรวจ", "ค่าที่ได้", "ค่าที่วัดได้")
                             VALUES (?, ?, ?, ?, ?)
                         ''', (station, param, f'ครั้งที่ {i}', value, numeric_value))
+                        update_series_stats(cur, 'soil', station, param, f'ครั้งที่ {i}', numeric_value)
                         pass
 
+            # 6. ลงทะเบียนสถานีใน catalog ใน transaction เดียวกับข้อมูล (PRIMARY KEY กันรหัสซ้ำที่เพิ่มพร้อมกัน)
+            cur.execute('INSERT INTO catalog.station_basin (station, basin) VALUES (?, ?)', (station, basin))
             conn.commit()
             conn.close()
+            invalidate_catalog()
+            compact_committed(path)
             return jsonify({'success': True})
 
         except Exception as e:
             print("Error saving station:", str(e))
+            if conn is not None:
+                conn.close()
             return jsonify({'success': False, 'message': str(e)})
 
     # GET: แสดงฟอร์ม
@@ -430,22 +825,30 @@ def add_station():
 @app.route('/delete-station/<station_code>', methods=['DELETE'])
 @login_required
 def delete_station(station_code):
+    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        path = station_db_path(station_code, DB_PATH)
+        conn = connect_db(path)
         cur = conn.cursor()
+        attach_catalog(conn)
         
         # ลบข้อมูลทั้งหมดที่เกี่ยวข้องกับสถานีนี้
         cur.execute('DELETE FROM water_data WHERE TRIM("สถานี") = ?', (station_code.strip(),))
         cur.execute('DELETE FROM soil_data WHERE TRIM("สถานี") = ?', (station_code.strip(),))
         cur.execute('DELETE FROM station_data WHERE TRIM("สถานี") = ?', (station_code.strip(),))
+        delete_series_stats(cur, station_code)
+        cur.execute('DELETE FROM catalog.station_basin WHERE station = ?', (station_code.strip(),))
         
         conn.commit()
         conn.close()
-        pass
+        invalidate_catalog()
+        compact_committed(path)
         
         return jsonify({'success': True})
     except Exception as e:
         print("Error deleting station:", str(e))
+        if conn is not None:
+            conn.close()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/station/<station_code>')
@@ -458,11 +861,13 @@ def station_detail(station_code):
         
         water_data = get_water_data(station_code)
         soil_data = get_soil_data(station_code)
+        trends = get_station_trends(station_code)
         
         return render_template('station_detail.html',
                              station=station,
                              water_data=water_data,
-                             soil_data=soil_data)
+                             soil_data=soil_data,
+                             trends=trends)
     except Exception as e:
         return f"Error loading station: {str(e)}", 500
 
@@ -470,6 +875,7 @@ def station_detail(station_code):
 @login_required
 def edit_station(station_code):
     if request.method == 'POST':
+        conn = None
         try:
             # รับข้อมูลใหม่
             station = request.form['station'].strip()
@@ -479,19 +885,49 @@ def edit_station(station_code):
             province = request.form['province'].strip()
             location = request.form['location'].strip()
 
-            conn = sqlite3.connect(DB_PATH)
+            basin = river_basin(river)
+            if not basin:
+                return jsonify({'success': False, 'message': unknown_river_message(river)}), 400
+            old_path = find_station(station_code, DB_PATH)
+            if not old_path:
+                return jsonify({'success': False, 'message': f'ไม่พบสถานี: {station_code}'}), 404
+            if station != station_code.strip() and find_station(station, DB_PATH):
+                return jsonify({'success': False, 'message': f'รหัสสถานี {station} มีอยู่แล้ว'}), 400
+            new_path = ensure_basin(basin)
+            connect_db(new_path).close()
+
+            # ย้ายลุ่มน้ำและอัปเดต catalog ใน transaction เดียว: ไฟล์ปลายทางและ catalog ถูก ATTACH กับการเชื่อมต่อเดียวกัน
+            conn = connect_db(old_path)
             cur = conn.cursor()
+            attach_catalog(conn)
+            if new_path == old_path:
+                target = 'main'
+            else:
+                cur.execute('ATTACH DATABASE ? AS dest', (new_path,))
+                target = 'dest'
 
             # 1. อัปเดตข้อมูลสถานี
-            cur.execute('''
-                UPDATE station_data 
-                SET "สถานี" = ?, "\ufeffแม่น้ำ" = ?, "ตำบล" = ?, "อำเภอ" = ?, "จังหวัด" = ?, "บริเวณที่เก็บ" = ?
-                WHERE TRIM("สถานี") = ?
-            ''', (station, river, tambon, amphoe, province, location, station_code))
+            if target == 'main':
+                cur.execute('''
+                    UPDATE station_data 
+                    SET "สถานี" = ?, "\ufeffแม่น้ำ" = ?, "ตำบล" = ?, "อำเภอ" = ?, "จังหวัด" = ?, "บริเวณที่เก็บ" = ?
+                    WHERE TRIM("สถานี") = ?
+                ''', (station, river, tambon, amphoe, province, location, station_code))
+            else:
+                # ลุ่มน้ำเปลี่ยน (หรือสถานียังอยู่ในฐานข้อมูลหลัก) → ย้ายไปยังไฟล์ของลุ่มน้ำใหม่
+                cur.execute('DELETE FROM main.water_data WHERE TRIM("สถานี") = ?', (station_code,))
+                cur.execute('DELETE FROM main.soil_data WHERE TRIM("สถานี") = ?', (station_code,))
+                cur.execute('DELETE FROM main.station_data WHERE TRIM("สถานี") = ?', (station_code,))
+                delete_series_stats(cur, station_code)
+                cur.execute('''
+                    INSERT INTO dest.station_data ("สถานี", "\ufeffแม่น้ำ", "ตำบล", "อำเภอ", "จังหวัด", "บริเวณที่เก็บ")
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (station, river, tambon, amphoe, province, location))
 
             # 2. ลบข้อมูลน้ำและดินเดิม
-            cur.execute('DELETE FROM water_data WHERE TRIM("สถานี") = ?', (station_code,))
-            cur.execute('DELETE FROM soil_data WHERE TRIM("สถานี") = ?', (station_code,))
+            cur.execute(f'DELETE FROM {target}.water_data WHERE TRIM("สถานี") = ?', (station_code,))
+            cur.execute(f'DELETE FROM {target}.soil_data WHERE TRIM("สถานี") = ?', (station_code,))
+            delete_series_stats(cur, station_code, target)
 
             # 3. รับพารามิเตอร์ใหม่
             parameters = request.form.getlist('parameter[]')
@@ -512,10 +948,11 @@ def edit_station(station_code):
                                 numeric_value = 0.0 if value.startswith('<') else float(value)
                             except ValueError:
                                 pass
-                    cur.execute('''
-                        INSERT INTO water_data ("สถานี", "\ufeffสิ่งที่ตรวจ", "หน่วย", "ครั้งที่ตรวจ", "ค่าที่ได้", "ค่าที่วัดได้")
+                    cur.execute(f'''
+                        INSERT INTO {target}.water_data ("สถานี", "\ufeffสิ่งที่ตรวจ", "หน่วย", "ครั้งที่ตรวจ", "ค่าที่ได้", "ค่าที่วัดได้")
                         VALUES (?, ?, ?, ?, ?, ?)
                         ''', (station, param, unit, f'ครั้งที่ {i}', value, numeric_value))
+                    update_series_stats(cur, 'water', station, param, f'ครั้งที่ {i}', numeric_value, target)
 
             # 5. บันทึกข้อมูลดิน — ตรวจสอบจำนวนคอลัมน์จริง
             soil_check_count = int(request.form.get('soil_check_count', 8))
@@ -530,21 +967,33 @@ def edit_station(station_code):
                                 numeric_value = 0.0 if value.startswith('<') else float(value)
                             except ValueError:
                                 pass
-                        cur.execute('''
-                            INSERT INTO soil_data ("สถานี", "สารที่ตรวจ", "ครั้งที่ตรวจ", "ค่าที่ได้", "ค่าที่วัดได้")
+                        cur.execute(f'''
+                            INSERT INTO {target}.soil_data ("สถานี", "สารที่ตรวจ", "ครั้งที่ตรวจ", "ค่าที่ได้", "ค่าที่วัดได้")
                             VALUES (?, ?, ?, ?, ?)
                             ''', (station, param, f'ครั้งที่ {i}', value, numeric_value))
+                        update_series_stats(cur, 'soil', station, param, f'ครั้งที่ {i}', numeric_value, target)
+
+            # 6. ชี้สถานีไปยังลุ่มน้ำใหม่ แล้ว commit ทุกไฟล์พร้อมกัน
+            cur.execute('DELETE FROM catalog.station_basin WHERE station = ?', (station_code.strip(),))
+            cur.execute('INSERT OR REPLACE INTO catalog.station_basin (station, basin) VALUES (?, ?)', (station, basin))
             conn.commit()
             conn.close()
+            invalidate_catalog()
+            compact_committed(old_path)
+            if new_path != old_path:
+                compact_committed(new_path)
             return jsonify({'success': True})
 
         except Exception as e:
             print("Error updating station:", str(e))
+            if conn is not None:
+                # ปิดโดยไม่ commit = rollback ทุกไฟล์ที่ ATTACH ไว้ และปล่อย lock
+                conn.close()
             return jsonify({'success': False, 'message': str(e)})
 
     # GET: ดึงข้อมูลเดิมมา pre-fill
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect_db(station_db_path(station_code, DB_PATH))
         conn.row_factory = sqlite3.Row
 
         station_row = conn.execute('''
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for template rendering against synthetic data of increasing size
+"""
+
+import argparse
+import tempfile
+import timeit
+
+from jinja2 import Environment, FileSystemBytecodeCache
+
+from app import app
+
+# สิ่งที่ตรวจที่มีค่ามาตรฐานใน template (ให้ครอบคลุมทุกสาขาของ if-chain)
+LIMIT_PARAMETERS = ['สารหนู', 'แมงกานีส', 'ตะกั่ว', 'ปรอท', 'ทองแดง', 'สังกะสี', 'นิกเกิล', 'แคดเมียม', 'โครเมียม']
+
+# ค่าที่พบในข้อมูลจริง: ตัวเลข, ต่ำกว่าค่าที่อ่านได้, ND และ -
+SAMPLE_VALUES = ['0.012', '171', '<0.002', 'ND', '-', '0.18', '2650', '<0.100']
+
+# (จำนวนสิ่งที่ตรวจ, จำนวนครั้งที่ตรวจ)
+PIVOT_SIZES = [(8, 4), (16, 8), (32, 14), (64, 28), (128, 56)]
+
+STATION_COUNTS = [40, 400, 4000]
+
+def make_pivot(parameter_count, round_count, with_unit=True):
+    """Build data shaped like get_water_data()/get_soil_data() output"""
+    parameters = [LIMIT_PARAMETERS[i] if i < len(LIMIT_PARAMETERS) else f'สาร {i}'
+                  for i in range(parameter_count)]
+    check_numbers = list(range(1, round_count + 1))
+    pivot = {}
+    pivot_list = []
+    for p, param in enumerate(parameters):
+        check_values = {}
+        numeric_values = {}
+        for check_num in check_numbers:
+            value = SAMPLE_VALUES[(p + check_num) % len(SAMPLE_VALUES)]
+            check_values[str(check_num)] = value
+            try:
+                numeric_values[str(check_num)] = 0.0 if value.startswith('<') else float(value)
+            except ValueError:
+                numeric_values[str(check_num)] = 0
+        pivot[param] = {c: check_values[str(c)] for c in check_numbers}
+        row = {'parameter': param, 'check_values': check_values, 'numeric_values': numeric_values}
+        if with_unit:
+            row['unit'] = 'mg/l'
+        pivot_list.append(row)
+    return {
+        'pivot': pivot,
+        'pivot_list': pivot_list,
+        'pivot_list_filtered': pivot_list,
+        'check_numbers': check_numbers,
+        'units': {param: 'mg/l' for param in parameters},
+        'parameters': parameters,
+    }
+
+def make_stations(count):
+    """Build data shaped like get_stations() output"""
+    return [{
+        'id': i,
+        'river': f'แม่น้ำ {i % 5}',
+        'station': f'ST{i:04d}',
+        'location': f'จุดเก็บ {i}',
+        'tambon': f'ตำบล {i % 50}',
+        'amphoe': f'อำเภอ {i % 10}',
+        'province': f'จังหวัด {i % 3}',
+    } for i in range(count)]
+
+def best_time(render, repeat):
+    """Return the fastest of `repeat` runs in milliseconds"""
+    timer = timeit.Timer(render)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+def bench_station_detail(repeat):
+    print("station_detail.html")
+    print(f"  {'params':>6} {'rounds':>6} {'cells':>7} {'ms/render':>10} {'µs/cell':>8}")
+    station = {'station': 'KK01', 'river': 'กก', 'location': '-', 'tambon': '-', 'amphoe': '-', 'province': '-'}
+    template = app.jinja_env.get_template('station_detail.html')
+    for parameter_count, round_count in PIVOT_SIZES:
+        context = {
+            'station': station,
+            'water_data': make_pivot(parameter_count, round_count),
+            'soil_data': make_pivot(parameter_count, round_count, with_unit=False),
+            'trends': {'water': [], 'soil': []},
+        }
+        with app.test_request_context('/station/KK01'):
+            app.update_template_context(context)
+            ms = best_time(lambda: template.render(context), repeat)
+        cells = parameter_count * round_count * 2
+        print(f"  {parameter_count:>6} {round_count:>6} {cells:>7} {ms:>10.2f} {ms * 1000 / cells:>8.2f}")
+
+def bench_index(repeat):
+    print("index.html")
+    print(f"  {'stations':>8} {'ms/render':>10} {'µs/station':>10}")
+    template = app.jinja_env.get_template('index.html')
+    for count in STATION_COUNTS:
+        stations = make_stations(count)
+        context = {
+            'stations': stations,
+            'unique_rivers': sorted({s['river'] for s in stations}),
+            'unique_provinces': sorted({s['province'] for s in stations}),
+            'unique_tambons': sorted({s['tambon'] for s in stations}),
+            'unique_amphoes': sorted({s['amphoe'] for s in stations}),
+            'location_hierarchy': {},
+        }
+        with app.test_request_context('/'):
+            app.update_template_context(context)
+            ms = best_time(lambda: template.render(context), repeat)
+        print(f"  {count:>8} {ms:>10.2f} {ms * 1000 / count:>10.2f}")
+
+def bench_cold_start():
+    """Time the first load of each template, without and with a warm bytecode cache"""
+    print("cold start (first get_template in a new worker)")
+    print(f"  {'template':<22} {'compile ms':>10} {'cached ms':>10}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name in sorted(app.jinja_env.list_templates()):
+            def load(bytecode_cache):
+                env = Environment(loader=app.jinja_env.loader, bytecode_cache=bytecode_cache, auto_reload=False)
+                env.globals.update(app.jinja_env.globals)
+                env.filters.update(app.jinja_env.filters)
+                env.get_template(name)
+
+            compile_ms = timeit.timeit(lambda: load(None), number=5) / 5 * 1000
+            load(FileSystemBytecodeCache(cache_dir))
+            cached_ms = timeit.timeit(lambda: load(FileSystemBytecodeCache(cache_dir)), number=5) / 5 * 1000
+            print(f"  {name:<22} {compile_ms:>10.2f} {cached_ms:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing runs per size')
+    args = parser.parse_args()
+
+    bench_cold_start()
+    print()
+    bench_station_detail(args.repeat)
+    print()
+    bench_index(args.repeat)
+
+if __name__ == "__main__":
+    main()
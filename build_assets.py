@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build static assets: vendor JS, minify CSS bundles, fingerprint files and
+write precompressed gzip/brotli variants plus a manifest for app.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# ไฟล์ JS ที่เคยโหลดจาก CDN → เก็บไว้ใน static/vendor
+# ต้องระบุ sha256 ของไฟล์ก่อนจึงจะ vendor ได้ (ดูค่าได้ด้วย --print-digests หลังวางไฟล์ที่ตรวจสอบแล้วใน static/vendor)
+# ถ้ายังไม่ได้ระบุ หน้าเว็บจะโหลดจาก CDN ตามเดิม
+VENDOR_ASSETS = {
+    # ไฟล์ที่อยู่ในแพ็กเกจ npm จริง (ไม่ใช่ .min.js ที่ jsDelivr ย่อให้ตอนเรียก ซึ่ง hash อาจเปลี่ยนได้)
+    'vendor/chart.umd.js': {
+        'url': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js',
+        'sha256': '321e3a3fa98da4aaa957d10be57cbb514de0989eed8f9d726b5d05902cd01904',
+    },
+    'vendor/chartjs-plugin-annotation.min.js': {
+        'url': 'https://cdn.jsdelivr.net/npm/chartjs-plugin-annotation@3.0.1/dist/chartjs-plugin-annotation.min.js',
+        'sha256': 'f010c3c42842c98381f34ffa5613a99abeea2391080f20cfcf1b1678f3c555fa',
+    },
+}
+
+# ชื่อ bundle → ไฟล์ CSS ต้นทางที่รวมเข้าด้วยกัน (แต่ละหน้าใช้ stylesheet ของตัวเอง)
+CSS_BUNDLES = {
+    'css/style.css': ['css/style.css'],
+    'css/style1.css': ['css/style1.css'],
+    'css/style2.css': ['css/style2.css'],
+    'css/login_style.css': ['css/login_style.css'],
+}
+
+# โฟลเดอร์ที่คัดลอกไปพร้อมใส่ hash โดยไม่แก้ไขเนื้อหา
+COPY_DIRS = ['image']
+
+# ชนิดไฟล์ที่บีบอัดได้ (PNG บีบอัดมาแล้ว จึงไม่ต้องทำซ้ำ)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.ico'}
+
+# ไฟล์ที่ไม่อยู่ใน manifest แล้วยังเก็บไว้กี่วัน: worker ที่ยังไม่รีสตาร์ทและ HTML ที่ cache ไว้ยังอ้างชื่อเดิมอยู่
+ASSET_RETENTION_DAYS = 7
+
+def vendor_assets():
+    """Download pinned vendored JS files and verify their sha256
+
+    Returns the paths that passed verification. A mismatch (on download or
+    for a file already in static/vendor) stops the build.
+    """
+    verified = []
+    for path, asset in VENDOR_ASSETS.items():
+        if not asset['sha256']:
+            print(f"  ⚠️  {path} has no sha256 pin, pages keep loading it from the CDN")
+            continue
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.exists(target):
+            with open(target, 'rb') as f:
+                data = f.read()
+        else:
+            try:
+                with urllib.request.urlopen(asset['url'], timeout=30) as response:
+                    data = response.read()
+            except OSError as e:
+                raise SystemExit(f"  ✗ Cannot download {asset['url']}: {e}")
+
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != asset['sha256']:
+            raise SystemExit(f"  ✗ sha256 mismatch for {path}: expected {asset['sha256']}, got {digest}")
+
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+        verified.append(path)
+        print(f"  ✓ Vendored {path}")
+    return verified
+
+def print_digests():
+    """Print the sha256 of files in static/vendor, for pinning in VENDOR_ASSETS"""
+    for path in VENDOR_ASSETS:
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.exists(target):
+            with open(target, 'rb') as f:
+                print(f"{hashlib.sha256(f.read()).hexdigest()}  {path}")
+        else:
+            print(f"{'-' * 64}  {path} (missing)")
+
+def minify_css(css):
+    """Remove comments and unnecessary whitespace from CSS"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+def build_css_bundle(sources):
+    """Concatenate and minify CSS files, keeping @import rules at the top"""
+    imports = []
+    rules = []
+    for source in sources:
+        with open(os.path.join(STATIC_DIR, source), 'r', encoding='utf-8') as f:
+            css = f.read()
+        for line in re.findall(r'^\s*@import[^;]*;', css, flags=re.M):
+            imports.append(line.strip())
+        rules.append(re.sub(r'^\s*@import[^;]*;', '', css, flags=re.M))
+    return minify_css('\n'.join(imports + rules)).encode('utf-8')
+
+def write_fingerprinted(path, data, manifest):
+    """Write data under a content-hashed name and record it in the manifest"""
+    stem, ext = os.path.splitext(path)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    hashed_path = f"{stem}.{digest}{ext}"
+    target = os.path.join(DIST_DIR, hashed_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    with open(target, 'wb') as f:
+        f.write(data)
+    if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+        with open(target + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+    manifest[path] = hashed_path
+    return hashed_path
+
+def load_manifest():
+    """Return the manifest of the previous build, or {}"""
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def prune_dist(manifest, previous, keep_days):
+    """Delete hashed files that have been out of the manifest for keep_days
+
+    Files dropped by this build get their mtime reset, so the retention
+    period counts from when they were superseded, not when they were built.
+    """
+    now = time.time()
+    current = set(manifest.values())
+    for hashed_path in set(previous.values()) - current:
+        for suffix in ('', '.gz', '.br'):
+            target = os.path.join(DIST_DIR, hashed_path + suffix)
+            if os.path.exists(target):
+                os.utime(target, (now, now))
+
+    removed = 0
+    for root, _, names in os.walk(DIST_DIR):
+        for name in names:
+            target = os.path.join(root, name)
+            path = os.path.relpath(target, DIST_DIR).replace(os.sep, '/')
+            if path.endswith(('.gz', '.br')):
+                path = path[:-3]
+            if target == MANIFEST_PATH or path in current:
+                continue
+            if now - os.path.getmtime(target) > keep_days * 86400:
+                os.remove(target)
+                removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets")
+    parser.add_argument('--print-digests', action='store_true',
+                        help='print sha256 of files in static/vendor and exit')
+    parser.add_argument('--keep-days', type=float, default=ASSET_RETENTION_DAYS,
+                        help='days to keep files that are no longer in the manifest')
+    args = parser.parse_args()
+    if args.print_digests:
+        print_digests()
+        return
+
+    print("Vendoring JS...")
+    vendored = vendor_assets()
+
+    # ไม่ลบ dist ทั้งโฟลเดอร์: ชื่อไฟล์เดิมต้องยังใช้ได้จนกว่าจะพ้นช่วง ASSET_RETENTION_DAYS
+    os.makedirs(DIST_DIR, exist_ok=True)
+    previous = load_manifest()
+    manifest = {}
+
+    print("Building CSS bundles...")
+    for bundle, sources in CSS_BUNDLES.items():
+        hashed_path = write_fingerprinted(bundle, build_css_bundle(sources), manifest)
+        print(f"  ✓ {bundle} → {hashed_path}")
+
+    print("Fingerprinting static files...")
+    for folder in COPY_DIRS:
+        source_dir = os.path.join(STATIC_DIR, folder)
+        if not os.path.isdir(source_dir):
+            continue
+        for name in sorted(os.listdir(source_dir)):
+            source = os.path.join(source_dir, name)
+            if os.path.isfile(source):
+                with open(source, 'rb') as f:
+                    write_fingerprinted(f"{folder}/{name}", f.read(), manifest)
+
+    # เฉพาะไฟล์ JS ที่ผ่านการตรวจ sha256 เท่านั้นที่ถูกเสิร์ฟจากเครื่องเรา
+    for path in vendored:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            write_fingerprinted(path, f.read(), manifest)
+
+    with open(MANIFEST_PATH + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(MANIFEST_PATH + '.tmp', MANIFEST_PATH)
+    removed = prune_dist(manifest, previous, args.keep_days)
+
+    if brotli is None:
+        print("  ⚠️  brotli is not installed, only gzip variants were written")
+    print(f"\n✓ Build complete: {len(manifest)} assets")
+    print(f"  Manifest: {MANIFEST_PATH}")
+    print(f"  Removed {removed} files superseded more than {args.keep_days:g} days ago")
+
+if __name__ == "__main__":
+    main()
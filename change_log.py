@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Change feed of a database file: change_log filled by triggers, plus the
+epoch/horizon bookkeeping shared by app.py, partitions.py and
+convert_csv_to_sqlite.py
+"""
+
+import os
+import secrets
+import sqlite3
+
+# บันทึกการเปลี่ยนแปลงของ station_data / water_data / soil_data
+# ทุก INSERT/UPDATE/DELETE ถูกบันทึกผ่าน trigger ลงตาราง change_log โดยมี seq เพิ่มขึ้นเรื่อยๆ
+# เพื่อให้ระบบปลายทางดึงเฉพาะส่วนที่เปลี่ยนผ่าน /api/changes?since=<seq>
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 30))
+CHANGE_FEED_PAGE_SIZE = 5000
+
+# คอลัมน์ที่ส่งออกไปกับ change feed ของแต่ละตาราง (ใช้ชื่อเดียวกับ API อื่นๆ)
+CHANGE_TABLES = {
+    'station_data': '''
+        SELECT id, "\ufeffแม่น้ำ" as river, "สถานี" as station, "บริเวณที่เก็บ" as location,
+               "ตำบล" as tambon, "อำเภอ" as amphoe, "จังหวัด" as province
+        FROM station_data WHERE id = ?
+    ''',
+    'water_data': '''
+        SELECT id, "\ufeffสิ่งที่ตรวจ" as parameter, "สถานี" as station, "ที่ตั้ง" as location,
+               "ครั้งที่ตรวจ" as check_number, "ค่าที่ได้" as value, "ค่าที่วัดได้" as numeric_value, "หน่วย" as unit
+        FROM water_data WHERE id = ?
+    ''',
+    'soil_data': '''
+        SELECT id, "สารที่ตรวจ" as parameter, "สถานี" as station, "บริเวณจุดเก็บ" as location,
+               "ครั้งที่ตรวจ" as check_number, "ค่าที่ได้" as value, "ค่าที่วัดได้" as numeric_value
+        FROM soil_data WHERE id = ?
+    ''',
+}
+
+def init_change_log(conn):
+    """Create change_log table and triggers if they do not exist yet"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            station TEXT,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id)')
+    create_change_log_meta(conn)
+    # epoch เปลี่ยนทุกครั้งที่สร้างฐานข้อมูลใหม่ (เช่น รัน convert_csv_to_sqlite.py) เพื่อให้ผู้ใช้ sync ใหม่ทั้งหมด
+    conn.execute("INSERT OR IGNORE INTO change_log_meta (key, value) VALUES ('epoch', ?)", (secrets.token_hex(8),))
+    # ข้อมูลที่มีอยู่ก่อนเริ่มบันทึกไม่อยู่ใน feed → ผู้ที่เริ่มจาก since=0 ต้อง sync ทั้งหมดก่อน
+    has_data = any(conn.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone() for table in CHANGE_TABLES)
+    conn.execute("INSERT OR IGNORE INTO change_log_meta (key, value) VALUES ('horizon', ?)",
+                 ('1' if has_data else '0',))
+    advance_change_seq(conn, get_change_log_meta(conn)[1])
+
+    for table in CHANGE_TABLES:
+        for op, ref in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{op}_log
+                AFTER {op.upper()} ON "{table}"
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op, station)
+                    VALUES ('{table}', {ref}.id, '{op}', TRIM({ref}."สถานี"));
+                END
+            ''')
+    conn.commit()
+
+def create_change_log_meta(conn, schema='main'):
+    """Create the table holding the epoch and horizon of a file's feed"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.change_log_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+def get_change_log_meta(conn):
+    """Return (epoch, horizon) of the change log"""
+    meta = dict(conn.execute('SELECT key, value FROM change_log_meta').fetchall())
+    return meta['epoch'], int(meta['horizon'])
+
+def compact_change_log(conn):
+    """Drop superseded entries and entries older than the retention window
+
+    Only the latest entry of each row is needed to bring a consumer up to date,
+    so older entries of the same row can always be removed. Entries older than
+    CHANGE_LOG_RETENTION_DAYS are dropped and the horizon is moved forward;
+    consumers behind the horizon must do a full sync again.
+    """
+    conn.execute('''
+        DELETE FROM change_log
+        WHERE seq NOT IN (SELECT MAX(seq) FROM change_log GROUP BY table_name, row_id)
+    ''')
+    cutoff = conn.execute('''
+        SELECT MAX(seq) FROM change_log
+        WHERE changed_at < strftime('%Y-%m-%dT%H:%M:%SZ', 'now', ?)
+    ''', (f'-{CHANGE_LOG_RETENTION_DAYS} days',)).fetchone()[0]
+    if cutoff is not None:
+        conn.execute('DELETE FROM change_log WHERE seq <= ?', (cutoff,))
+        conn.execute('''
+            UPDATE change_log_meta SET value = MAX(CAST(value AS INTEGER), ?)
+            WHERE key = 'horizon'
+        ''', (cutoff,))
+    conn.commit()
+
+def get_changes(conn, since, limit=CHANGE_FEED_PAGE_SIZE):
+    """Yield changes after `since` with the current row data attached"""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.execute('''
+        SELECT seq, table_name, row_id, op, station, changed_at
+        FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?
+    ''', (since, limit))
+    for entry in cursor.fetchall():
+        change = {
+            'seq': entry['seq'],
+            'table': entry['table_name'],
+            'op': entry['op'],
+            'id': entry['row_id'],
+            'station': entry['station'],
+            'changed_at': entry['changed_at'],
+            'row': None,
+        }
+        if entry['op'] != 'delete':
+            row = conn.execute(CHANGE_TABLES[entry['table_name']], (entry['row_id'],)).fetchone()
+            if row:
+                row_dict = dict(row)
+                for key, value in row_dict.items():
+                    if isinstance(value, str):
+                        row_dict[key] = value.strip()
+                change['row'] = row_dict
+        yield change
+
+def table_names(conn, schema='main'):
+    return {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+
+def advance_change_seq(conn, seq, schema='main'):
+    """Make the next change_log entry of a file get a seq above `seq`"""
+    if 'sqlite_sequence' not in table_names(conn, schema):
+        return
+    if not conn.execute(f"SELECT 1 FROM {schema}.sqlite_sequence WHERE name = 'change_log'").fetchone():
+        conn.execute(f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES ('change_log', ?)", (seq,))
+    else:
+        conn.execute(f"UPDATE {schema}.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'change_log'", (seq,))
+
+def last_change_seq(conn, schema='main'):
+    """Return the newest seq of a file's change feed (0 if it has none)"""
+    tables = table_names(conn, schema)
+    seq = 0
+    if 'sqlite_sequence' in tables:
+        row = conn.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'change_log'").fetchone()
+        seq = row[0] if row else 0
+    if 'change_log_meta' in tables:
+        row = conn.execute(f"SELECT value FROM {schema}.change_log_meta WHERE key = 'horizon'").fetchone()
+        seq = max(seq, int(row[0])) if row else seq
+    return seq
+
+def reset_change_feed(conn, schema='main', start_seq=1):
+    """Give a file's change feed a new epoch and move its horizon to start_seq
+
+    Used when rows are written without being logged (migration, CSV import):
+    consumers of the file get 410 and do a full resync, then continue from
+    start_seq.
+    """
+    create_change_log_meta(conn, schema)
+    conn.execute(f"INSERT OR REPLACE INTO {schema}.change_log_meta (key, value) VALUES ('epoch', ?)",
+                 (secrets.token_hex(8),))
+    conn.execute(f"INSERT OR REPLACE INTO {schema}.change_log_meta (key, value) VALUES ('horizon', ?)",
+                 (str(start_seq),))
+    advance_change_seq(conn, start_seq, schema)
@@ -4,87 +4,176 @@
 Convert CSV files in the csv folder to SQLite database
 """
 
+import argparse
 import csv
 import sqlite3
 import os
 from pathlib import Path
 
+from change_log import last_change_seq, reset_change_feed, table_names
+from partitions import (BASINS, TABLE_COLUMNS, create_partition_schema, river_basin, ensure_basin, basin_path,
+                        assign_stations, get_station_basin)
+
 # Database file path
 DB_PATH = "kok_data.db"
 
 # CSV folder path
 CSV_FOLDER = "csv"
 
-def create_table_from_csv(conn, csv_path, table_name):
-    """Create a table from CSV file and import data"""
-    print(f"Processing {csv_path}...")
-    
+def read_csv_rows(csv_path):
+    """Read a CSV file as dicts keyed by the stripped column names"""
     with open(csv_path, 'r', encoding='utf-8') as f:
-        # Read first line to get column names
         reader = csv.reader(f)
-        columns = next(reader)
-        
-        # Clean column names (remove spaces, replace special chars)
-        clean_columns = [col.strip() for col in columns]
-        
-        # Create table with columns
-        placeholders = ', '.join([f'"{col}" TEXT' for col in clean_columns])
-        create_table_sql = f'''
-        CREATE TABLE IF NOT EXISTS "{table_name}" (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            {placeholders}
-        )
-        '''
-        
-        conn.execute(create_table_sql)
-        
-        # Insert data
+        columns = [col.strip() for col in next(reader)]
+        return [dict(zip(columns, row)) for row in reader]
+
+def parse_numeric_value(value):
+    """Numeric value of a measurement, same rule as the add/edit forms"""
+    value = value.strip()
+    if not value or value in ['-', 'ND']:
+        return None
+    try:
+        return 0.0 if value.startswith('<') else float(value)
+    except ValueError:
+        return None
+
+def insert_rows(conn, tables):
+    """Insert CSV rows into the data tables, filling the numeric value column"""
+    rows_inserted = 0
+    for table, rows in tables.items():
+        columns = TABLE_COLUMNS[table][1:]
         insert_sql = f'''
-        INSERT INTO "{table_name}" ({', '.join([f'"{col}"' for col in clean_columns])})
-        VALUES ({', '.join(['?' for _ in clean_columns])})
+        INSERT INTO "{table}" ({', '.join([f'"{col}"' for col in columns])})
+        VALUES ({', '.join(['?' for _ in columns])})
         '''
-        
-        rows_inserted = 0
-        for row in reader:
-            # Pad row if it's shorter than columns
-            while len(row) < len(clean_columns):
-                row.append('')
-            # Truncate row if it's longer than columns
-            row = row[:len(clean_columns)]
-            conn.execute(insert_sql, row)
+        for row in rows:
+            values = [row.get(col, '') for col in columns]
+            if 'ค่าที่วัดได้' in columns:
+                values[columns.index('ค่าที่วัดได้')] = parse_numeric_value(row.get('ค่าที่ได้', ''))
+            conn.execute(insert_sql, values)
             rows_inserted += 1
-        
+    return rows_inserted
+
+def remove_from_basin(basin, codes):
+    """Delete stations that moved to another basin from their old basin file"""
+    conn = sqlite3.connect(basin_path(basin))
+    tables = table_names(conn)
+    for code in codes:
+        for table in TABLE_COLUMNS:
+            conn.execute(f'DELETE FROM "{table}" WHERE TRIM("สถานี") = ?', (code,))
+        if 'series_stats' in tables:
+            conn.execute('DELETE FROM series_stats WHERE station = ?', (code,))
+    conn.commit()
+    conn.close()
+
+def import_partitioned(only_basin=None):
+    """Import CSV files into one database file per basin
+
+    Each basin is written to a temporary file and swapped in at the end, so
+    re-importing one basin never locks the others. The new file's change
+    feed starts with a new epoch past the old file's last seq, so consumers
+    of the basin do a full resync.
+    """
+    stations = read_csv_rows(os.path.join(CSV_FOLDER, 'station.csv'))
+    measurements = {
+        'water_data': read_csv_rows(os.path.join(CSV_FOLDER, 'water_raw_melted.csv')),
+        'soil_data': read_csv_rows(os.path.join(CSV_FOLDER, 'soil_raw_melted.csv')),
+    }
+
+    basins = {}
+    for row in stations:
+        river = row.get('\ufeffแม่น้ำ', '').strip()
+        basin = river_basin(river)
+        if not basin:
+            print(f"  ⚠️  {row.get('สถานี', '').strip()}: unknown river {river!r}, add it to BASINS first")
+            continue
+        basins.setdefault(basin, []).append(row)
+
+    total_rows = 0
+    for basin, basin_stations in basins.items():
+        if only_basin and basin != only_basin:
+            continue
+        codes = {row['สถานี'].strip() for row in basin_stations}
+        path = ensure_basin(basin)
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        create_partition_schema(conn)
+        tables = {'station_data': basin_stations}
+        for table, rows in measurements.items():
+            tables[table] = [row for row in rows if row.get('สถานี', '').strip() in codes]
+
+        rows_inserted = insert_rows(conn, tables)
+
+        old = sqlite3.connect(path)
+        reset_change_feed(conn, start_seq=last_change_seq(old) + 1)
+        old.close()
         conn.commit()
-        print(f"  ✓ Created table '{table_name}' with {rows_inserted} rows")
-        return rows_inserted
+        conn.close()
+
+        moved = {}
+        for code in codes:
+            previous = get_station_basin(code)
+            if previous and previous != basin:
+                moved.setdefault(previous, []).append(code)
+
+        os.replace(tmp_path, path)
+        assign_stations(basin, codes, replace=True)
+        # สถานีที่ย้ายลุ่มน้ำใน CSV ต้องไม่เหลือซ้ำในไฟล์เดิม
+        for previous, moved_codes in moved.items():
+            remove_from_basin(previous, moved_codes)
+        print(f"  ✓ {basin} → {os.path.basename(path)}: {len(codes)} stations, {rows_inserted} rows")
+        total_rows += rows_inserted
+
+    print(f"\n✓ Conversion complete!")
+    print(f"  Total rows imported: {total_rows}")
 
 def main():
-    # Remove existing database if it exists
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-        print(f"Removed existing database: {DB_PATH}")
-    
-    # Create SQLite connection
-    conn = sqlite3.connect(DB_PATH)
+    parser = argparse.ArgumentParser(description="Convert CSV files in the csv folder to SQLite")
+    parser.add_argument('--basin', choices=sorted(BASINS), help='import only this basin')
+    parser.add_argument('--single-file', action='store_true',
+                        help=f'rebuild everything into {DB_PATH} instead of per-basin partitions')
+    args = parser.parse_args()
+
+    if not args.single_file:
+        import_partitioned(args.basin)
+        return
+
+    # สร้างไฟล์ใหม่แล้วสลับเข้าแทน เหมือน import ทีละลุ่มน้ำ
+    tmp_path = DB_PATH + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
     print(f"Creating SQLite database: {DB_PATH}\n")
-    
-    # CSV files to process
+    create_partition_schema(conn)
+
     csv_files = {
         'water_raw_melted.csv': 'water_data',
         'soil_raw_melted.csv': 'soil_data',
         'station.csv': 'station_data'
     }
-    
-    total_rows = 0
+    tables = {}
     for csv_file, table_name in csv_files.items():
         csv_path = os.path.join(CSV_FOLDER, csv_file)
         if os.path.exists(csv_path):
-            rows = create_table_from_csv(conn, csv_path, table_name)
-            total_rows += rows
+            print(f"Processing {csv_path}...")
+            tables[table_name] = read_csv_rows(csv_path)
         else:
             print(f"  ✗ File not found: {csv_path}")
-    
+    total_rows = insert_rows(conn, tables)
+
+    start_seq = 1
+    if os.path.exists(DB_PATH):
+        old = sqlite3.connect(DB_PATH)
+        start_seq = last_change_seq(old) + 1
+        old.close()
+    reset_change_feed(conn, start_seq=start_seq)
+    conn.commit()
     conn.close()
+    os.replace(tmp_path, DB_PATH)
+
     print(f"\n✓ Conversion complete!")
     print(f"  Database: {DB_PATH}")
     print(f"  Total rows imported: {total_rows}")
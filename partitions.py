@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Basin-partitioned storage: one SQLite file per basin plus a catalog that
+maps station code to basin
+
+Rivers are grouped into the fixed set of basins in BASINS (or the JSON file
+named by BASINS_FILE). Stations that are not in the catalog yet stay in the
+main database (kok_data.db). Run this file to move them into their basins.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from change_log import table_names, last_change_seq, reset_change_feed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, "kok_data.db")
+PARTITION_DIR = os.environ.get('PARTITION_DIR') or os.path.join(BASE_DIR, "partitions")
+CATALOG_PATH = os.path.join(PARTITION_DIR, "catalog.db")
+
+# SQLite ต่อฐานข้อมูลเพิ่มได้สูงสุด 10 ไฟล์ต่อการเชื่อมต่อ (หนึ่งไฟล์ใช้กับ catalog)
+MAX_ATTACHED = 10
+
+# จำนวนชุดการเชื่อมต่อข้ามลุ่มน้ำที่เก็บไว้ใช้ซ้ำ (ประมาณจำนวน request ที่ทำงานพร้อมกัน)
+MAX_POOLED_NETWORKS = 4
+
+# ลุ่มน้ำ → แม่น้ำในลุ่มน้ำนั้น แต่ละลุ่มน้ำเก็บในไฟล์ partitions/<ลุ่มน้ำ>.db
+# แม่น้ำที่ไม่อยู่ในรายการจะถูกปฏิเสธ ต้องเพิ่มที่นี่ (หรือในไฟล์ BASINS_FILE) ก่อน
+DEFAULT_BASINS = {
+    'kok': ['แม่น้ำกก', 'แม่น้ำฝาง', 'แม่น้ำกรณ์', 'แม่น้ำลาว', 'แม่น้ำสรวย'],
+    'sai': ['แม่น้ำสาย'],
+    'ruak': ['แม่น้ำรวก'],
+    'mekong': ['แม่น้ำโขง'],
+}
+
+# คอลัมน์ของแต่ละตาราง เรียงตามลำดับเดียวกับ kok_data.db
+TABLE_COLUMNS = {
+    'station_data': ['id', '\ufeffแม่น้ำ', 'สถานี', 'บริเวณที่เก็บ', 'ตำบล', 'อำเภอ', 'จังหวัด'],
+    'water_data': ['id', '\ufeffสิ่งที่ตรวจ', 'สถานี', 'ที่ตั้ง', 'ครั้งที่ตรวจ', 'ค่าที่ได้', 'หน่วย', 'ค่าที่วัดได้'],
+    'soil_data': ['id', 'สารที่ตรวจ', 'สถานี', 'บริเวณจุดเก็บ', 'ครั้งที่ตรวจ', 'ค่าที่ได้', 'ค่าที่วัดได้'],
+}
+
+# ตารางที่รวมจากทุก partition สำหรับ query ข้ามลุ่มน้ำ → คอลัมน์รหัสสถานี
+NETWORK_TABLES = {
+    'station_data': '"สถานี"',
+    'water_data': '"สถานี"',
+    'soil_data': '"สถานี"',
+    'series_stats': 'station',
+}
+
+def load_basins():
+    """Return {basin: [river, ...]} from BASINS_FILE, or the built-in list"""
+    path = os.environ.get('BASINS_FILE')
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            basins = json.load(f)
+    else:
+        basins = DEFAULT_BASINS
+    for basin in basins:
+        # ชื่อลุ่มน้ำใช้เป็นชื่อไฟล์และชื่อ schema ตอน ATTACH
+        if not re.fullmatch(r'[a-z0-9_]+', basin):
+            raise ValueError(f"invalid basin name: {basin!r}")
+    return basins
+
+def normalize_river(river):
+    """River name without surrounding spaces and the แม่น้ำ prefix"""
+    river = ' '.join((river or '').split())
+    return river[len('แม่น้ำ'):].strip() if river.startswith('แม่น้ำ') else river
+
+BASINS = load_basins()
+RIVER_BASINS = {normalize_river(river): basin for basin, rivers in BASINS.items() for river in rivers}
+
+def river_basin(river):
+    """Return the basin of a river, or None if the river is not known"""
+    return RIVER_BASINS.get(normalize_river(river))
+
+def basin_path(basin):
+    return os.path.join(PARTITION_DIR, f'{basin}.db')
+
+def quote_columns(columns):
+    return ', '.join(f'"{col}"' for col in columns)
+
+def create_partition_schema(conn):
+    """Create the data tables of a partition"""
+    for table, columns in TABLE_COLUMNS.items():
+        definitions = ['id INTEGER PRIMARY KEY AUTOINCREMENT']
+        for col in columns[1:]:
+            definitions.append(f'"{col}" REAL' if col == 'ค่าที่วัดได้' else f'"{col}" TEXT')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(definitions)})')
+    conn.commit()
+
+def ensure_basin(basin):
+    """Return the file of a basin, creating it if needed"""
+    path = basin_path(basin)
+    if not os.path.exists(path):
+        os.makedirs(PARTITION_DIR, exist_ok=True)
+        conn = sqlite3.connect(path)
+        create_partition_schema(conn)
+        conn.close()
+    return path
+
+def file_signature(path):
+    """(inode, mtime, size) of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def connect_catalog():
+    """Open the catalog for writing, creating it if needed"""
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    conn = sqlite3.connect(CATALOG_PATH)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS station_basin (
+            station TEXT PRIMARY KEY,
+            basin TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    return conn
+
+def attach_catalog(conn):
+    """Attach the catalog as `catalog`, so a data write and its catalog update commit together"""
+    connect_catalog().close()
+    conn.execute('ATTACH DATABASE ? AS catalog', (CATALOG_PATH,))
+
+def list_partitions():
+    """Return every basin that has a file as {'name', 'rivers', 'path'}"""
+    return [{
+        'name': basin,
+        'rivers': rivers,
+        'path': basin_path(basin),
+    } for basin, rivers in BASINS.items() if os.path.exists(basin_path(basin))]
+
+# สำเนาของ catalog ในหน่วยความจำ โหลดใหม่เมื่อไฟล์ catalog เปลี่ยน (รวมถึงการแก้จาก process อื่น)
+_catalog_cache = {'signature': None, 'stations': {}}
+
+def load_catalog():
+    """Return {station: basin}, re-reading the catalog only when the file changed"""
+    signature = file_signature(CATALOG_PATH)
+    if signature != _catalog_cache['signature']:
+        stations = {}
+        if signature is not None:
+            catalog = sqlite3.connect(f'file:{CATALOG_PATH}?mode=ro', uri=True)
+            stations = dict(catalog.execute('SELECT station, basin FROM station_basin').fetchall())
+            catalog.close()
+        _catalog_cache.update(signature=signature, stations=stations)
+    return _catalog_cache['stations']
+
+def invalidate_catalog():
+    """Drop the cached catalog after writing to it (mtime may not change within a tick)"""
+    _catalog_cache['signature'] = None
+
+def get_station_basin(station_code):
+    """Return the basin of a catalogued station, or None"""
+    return load_catalog().get(station_code.strip())
+
+def station_db_path(station_code, db_path=DB_PATH):
+    """Return the file holding a station: its basin, or the main database"""
+    basin = get_station_basin(station_code)
+    return basin_path(basin) if basin else db_path
+
+def find_station(station_code, db_path=DB_PATH):
+    """Return the file holding a station, or None if the code is not in use"""
+    path = station_db_path(station_code, db_path)
+    if path != db_path:
+        return path
+    conn = sqlite3.connect(db_path)
+    row = conn.execute('SELECT 1 FROM station_data WHERE TRIM("สถานี") = ? LIMIT 1', (station_code.strip(),)).fetchone()
+    conn.close()
+    return db_path if row else None
+
+def assign_stations(basin, stations, replace=False):
+    """Map station codes to a basin
+
+    With replace=True the basin's previous stations are unmapped first
+    (used when a whole basin is re-imported).
+    """
+    catalog = connect_catalog()
+    if replace:
+        catalog.execute('DELETE FROM station_basin WHERE basin = ?', (basin,))
+    catalog.executemany('INSERT OR REPLACE INTO station_basin (station, basin) VALUES (?, ?)',
+                        [(station.strip(), basin) for station in stations])
+    catalog.commit()
+    catalog.close()
+    invalidate_catalog()
+
+def network_files(db_path=DB_PATH):
+    """Return (schema, path) of the main database and every basin file"""
+    return [('main_db', db_path)] + [(f'basin_{p["name"]}', p['path']) for p in list_partitions()]
+
+def connect_network_batch(files):
+    """Open an in-memory connection with some of the network files attached
+
+    Temporary views named after the data tables combine the attached files,
+    so queries written for a single file keep working. Rows left in the main
+    database for a station that the catalog places in a basin are hidden.
+    """
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    has_catalog = os.path.exists(CATALOG_PATH)
+    if has_catalog:
+        conn.execute('ATTACH DATABASE ? AS catalog', (CATALOG_PATH,))
+    for schema, path in files:
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+
+    for table, station_column in NETWORK_TABLES.items():
+        selects = []
+        for schema, _ in files:
+            if not conn.execute(
+                f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone():
+                continue
+            if schema == 'main_db' and has_catalog:
+                selects.append(f'SELECT * FROM main_db."{table}" '
+                               f'WHERE TRIM({station_column}) NOT IN (SELECT station FROM catalog.station_basin)')
+            else:
+                selects.append(f'SELECT * FROM {schema}."{table}"')
+        if selects:
+            conn.execute(f'CREATE TEMP VIEW "{table}" AS {" UNION ALL ".join(selects)}')
+    return conn
+
+# ชุดการเชื่อมต่อที่ ATTACH และสร้าง view ไว้แล้ว ใช้ซ้ำได้จนกว่าจะมีไฟล์ถูกเพิ่มหรือสร้างใหม่
+_network_pool = []
+_network_key = None
+_network_lock = threading.Lock()
+
+def network_key(files):
+    """Identify a set of network files; changes when any file is added, replaced or written"""
+    return (file_signature(CATALOG_PATH),) + tuple((schema, path, file_signature(path)) for schema, path in files)
+
+def acquire_network(files, key):
+    """Return batched connections over files, reusing an idle set if possible"""
+    global _network_key
+    with _network_lock:
+        if key != _network_key:
+            for batches in _network_pool:
+                for conn in batches:
+                    conn.close()
+            _network_pool.clear()
+            _network_key = key
+        elif _network_pool:
+            return _network_pool.pop()
+    batch_size = MAX_ATTACHED - 1
+    return [connect_network_batch(files[start:start + batch_size]) for start in range(0, len(files), batch_size)]
+
+def release_network(key, batches):
+    """Return connections to the pool, or close them if the files changed meanwhile"""
+    with _network_lock:
+        if key == _network_key and len(_network_pool) < MAX_POOLED_NETWORKS:
+            _network_pool.append(batches)
+            return
+    for conn in batches:
+        conn.close()
+
+def network_query(sql, params=(), db_path=DB_PATH, sort_key=None, reverse=False, limit=None):
+    """Run a query over the main database and every basin, returning dicts
+
+    SQLite can only attach a few files per connection, so the files are
+    queried in batches and the rows merged here; sort_key/reverse/limit
+    repeat the query's ORDER BY and LIMIT across batches.
+    """
+    files = network_files(db_path)
+    key = network_key(files)
+    batches = acquire_network(files, key)
+    rows = []
+    try:
+        for conn in batches:
+            rows.extend(dict(row) for row in conn.execute(sql, params).fetchall())
+    except Exception:
+        for conn in batches:
+            conn.close()
+        raise
+    release_network(key, batches)
+    if sort_key and len(batches) > 1:
+        rows.sort(key=sort_key, reverse=reverse)
+    return rows if limit is None else rows[:limit]
+
+def migrate(db_path=DB_PATH):
+    """Move every uncatalogued station from the main database into its basin
+
+    Everything happens in one transaction across the main database, the
+    basin files and the catalog. The moves are not changes of the data, so
+    they are removed from the main database's change feed, which then
+    starts a new epoch; basin files that had no feed yet start with one
+    that forces a full resync.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    stations = conn.execute('''
+        SELECT TRIM("\ufeffแม่น้ำ"), TRIM("สถานี") FROM station_data
+        WHERE "สถานี" IS NOT NULL AND TRIM("สถานี") != ''
+    ''').fetchall()
+
+    plan = {}
+    for river, station in stations:
+        if get_station_basin(station):
+            continue
+        basin = river_basin(river)
+        if not basin:
+            print(f"  ⚠️  {station}: unknown river {river!r}, add it to BASINS first")
+            continue
+        plan.setdefault(basin, []).append(station)
+    if not plan:
+        conn.close()
+        return 0
+
+    connect_catalog().close()
+    conn.execute('ATTACH DATABASE ? AS catalog', (CATALOG_PATH,))
+    for basin in plan:
+        conn.execute(f'ATTACH DATABASE ? AS basin_{basin}', (ensure_basin(basin),))
+    tables = {schema: table_names(conn, schema) for schema in ['main'] + [f'basin_{basin}' for basin in plan]}
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        seq_before = last_change_seq(conn)
+        for basin, codes in plan.items():
+            schema = f'basin_{basin}'
+            placeholders = ', '.join('?' for _ in codes)
+            for table, columns in TABLE_COLUMNS.items():
+                # ไฟล์ลุ่มน้ำอาจมีสถานีที่เพิ่มผ่านหน้าเว็บอยู่แล้ว จึงให้ไฟล์ปลายทางกำหนด id ใหม่เอง
+                cols = quote_columns(columns[1:])
+                conn.execute(f'''
+                    INSERT INTO {schema}."{table}" ({cols})
+                    SELECT {cols} FROM main."{table}" WHERE TRIM("สถานี") IN ({placeholders})
+                ''', codes)
+                conn.execute(f'DELETE FROM main."{table}" WHERE TRIM("สถานี") IN ({placeholders})', codes)
+
+            # สถิติคิดแยกตามสถานี จึงย้ายตามไปได้เลย ถ้าไม่มีให้ย้าย app.py จะคำนวณใหม่เมื่อเปิดไฟล์ครั้งแรก
+            if 'series_stats' in tables['main']:
+                if 'series_stats' in tables[schema]:
+                    conn.execute(f'INSERT OR REPLACE INTO {schema}.series_stats SELECT * FROM main.series_stats '
+                                 f'WHERE station IN ({placeholders})', codes)
+                conn.execute(f'DELETE FROM main.series_stats WHERE station IN ({placeholders})', codes)
+            elif 'series_stats' in tables[schema]:
+                conn.execute(f'DROP TABLE {schema}.series_stats')
+
+            conn.executemany('INSERT OR REPLACE INTO catalog.station_basin (station, basin) VALUES (?, ?)',
+                             [(station, basin) for station in codes])
+            if 'change_log' not in tables[schema]:
+                reset_change_feed(conn, schema)
+            print(f"  ✓ {basin}: {', '.join(codes)}")
+
+        if 'change_log' in tables['main']:
+            # การย้ายไม่ใช่การลบข้อมูล: ตัดรายการ delete ที่ trigger บันทึกไว้ และให้ผู้ใช้ feed sync ใหม่
+            conn.execute('DELETE FROM main.change_log WHERE seq > ?', (seq_before,))
+            reset_change_feed(conn, 'main', last_change_seq(conn))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        invalidate_catalog()
+        conn.close()
+    return sum(len(codes) for codes in plan.values())
+
+def main():
+    print(f"Moving stations from {DB_PATH} into {PARTITION_DIR}\n")
+    moved = migrate()
+    print(f"\n✓ Migration complete! Stations moved: {moved}")
+
+if __name__ == "__main__":
+    main()